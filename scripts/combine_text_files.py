@@ -1,12 +1,32 @@
 import os
+import sys
+import mmap
+import shutil
+import argparse
 import datetime
+import itertools
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 # Configuration
 OUTPUT_FILENAME = "combined_project_cpc.txt"
+# Write buffer for the combined output file
+OUTPUT_BUFFER_SIZE = 1 << 20
+# Without --verbose, a progress line is printed once per this many files
+PROGRESS_INTERVAL = 500
+# Without sendfile, files at least this big are mapped instead of read into memory
+MMAP_THRESHOLD = 16 * 1024
+# Minimum count per sendfile() call (same as shutil); otherwise the file size
+SENDFILE_BLOCKSIZE = 1 << 23
+# Chunk size for plain read/write copies
+COPY_CHUNK_SIZE = 1 << 20
 # Common text file extensions
 TEXT_FILE_EXTENSIONS = {
 ".rs"
 }
+# Tuple form for str.endswith(), which checks every suffix in a single C call
+TEXT_SUFFIXES = tuple(ext.lower() for ext in TEXT_FILE_EXTENSIONS)
 # Files and directories to ignore
 IGNORE_PATTERNS = {
     ".git", # Git directory
@@ -25,34 +45,216 @@ IGNORE_FILES_BY_NAME = {
 # This will be resolved to an absolute path later
 IGNORE_FILES_BY_NAME.add(os.path.basename(__file__))
 
+# Normalized once here so should_ignore only does a set lookup and a single
+# startswith() per entry: every pattern also matches as a path prefix from the
+# project root, and slash-less patterns match by name at any depth.
+IGNORE_DIR_PREFIXES = tuple(p.rstrip("/") + "/" for p in IGNORE_PATTERNS)
+IGNORE_EXACT_NAMES = frozenset(p for p in IGNORE_PATTERNS if "/" not in p) | IGNORE_FILES_BY_NAME
+# A prefix with N slashes can only match entries up to N levels deep; anything
+# below that is inside a directory that has already been pruned
+_MAX_PREFIX_DEPTH = max((p.count("/") for p in IGNORE_DIR_PREFIXES), default=0)
 
-def should_ignore(path, root_dir):
-    """Checks if a file or directory should be ignored."""
-    relative_path = os.path.relpath(path, root_dir)
-    normalized_path = relative_path.replace("\\", "/") + ("/" if os.path.isdir(path) else "")
 
-    if os.path.basename(path) in IGNORE_FILES_BY_NAME:
-        if os.path.basename(path) == OUTPUT_FILENAME and normalized_path == OUTPUT_FILENAME: # ensure it's the root output file
-             return True
-        elif os.path.basename(path) != OUTPUT_FILENAME: # other specifically named files
-             return True
+def should_ignore(entry, rel_dir, depth):
+    """Checks if a directory entry (os.DirEntry) should be ignored.
 
+    rel_dir is the "/"-separated path of the entry's parent relative to the
+    project root ("" at the top), and depth is the entry's own depth (1 at the
+    top). The name check comes first and needs no path at all; the relative
+    path is only built at depths an IGNORE_DIR_PREFIXES entry can match.
+    """
+    if entry.name in IGNORE_EXACT_NAMES:
+        return True
+    if depth > _MAX_PREFIX_DEPTH:
+        return False
 
-    for pattern in IGNORE_PATTERNS:
-        # Ensure directory patterns end with a slash for proper matching
-        pattern_to_match = pattern if pattern.endswith('/') else pattern
-        if normalized_path.startswith(pattern_to_match):
-            return True
-        # Also check for exact filename matches within IGNORE_PATTERNS (like package-lock.json)
-        if os.path.basename(path) == pattern and not pattern.endswith('/'):
-             return True
-    return False
+    normalized_path = rel_dir + entry.name
+    if entry.is_dir(follow_symlinks=False):
+        normalized_path += "/"
+    return normalized_path.startswith(IGNORE_DIR_PREFIXES)
 
 def is_text_file(filename):
     """Checks if a file is likely a text file based on its extension."""
-    return os.path.splitext(filename)[1].lower() in TEXT_FILE_EXTENSIONS
+    return filename.lower().endswith(TEXT_SUFFIXES)
+
+def _scan(root, rel_dir="", depth=1, onerror=None):
+    """Yields (entry, relative_path, ignored) for every file below root, depth first.
+
+    Uses os.scandir so the entry type comes from the readdir results instead of
+    an extra stat() per entry. Ignored directories are not descended into.
+    Like os.walk, directories that can't be listed are skipped; the OSError is
+    passed to onerror if one is given.
+    """
+    try:
+        it = os.scandir(root)
+    except OSError as e:
+        if onerror is not None:
+            onerror(e)
+        return
+
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if not should_ignore(entry, rel_dir, depth):
+                    yield from _scan(entry.path, rel_dir + entry.name + "/", depth + 1, onerror)
+            elif entry.is_file():
+                yield entry, rel_dir + entry.name, should_ignore(entry, rel_dir, depth)
+
+# Only Linux allows sendfile() between two regular files (same check as shutil)
+_USE_SENDFILE = hasattr(os, "sendfile") and sys.platform.startswith("linux")
+
+# Constant parts of the per-file markers, encoded once; only the path is
+# encoded per file. Pieces are passed to writelines() together, which feeds
+# them to the buffer without joining them into a new bytes object first.
+_START = b"\n\n--- START FILE: "
+_MID = b" ---\n"
+_END_PREFIX = b"\n--- END FILE: "
+_ERROR_PREFIX = b"\n\n--- ERROR READING FILE: "
+
+def _sendfile(src, out):
+    """Copies src to out with os.sendfile, returning False if it can't be used.
+
+    Like shutil's sendfile fast path, an error before any data has been sent
+    (ENOTSOCK, EINVAL, ...) just means the caller should copy normally; after
+    that it is re-raised. Copies until sendfile reports end of file rather than
+    stopping at the size fstat() gave, so a file that grows isn't cut short.
+    """
+    # sendfile writes at the fd's position, so anything still sitting in out's
+    # buffer has to go first
+    out.flush()
+    blocksize = max(os.fstat(src.fileno()).st_size, SENDFILE_BLOCKSIZE)
+    offset = 0
+    while True:
+        try:
+            sent = os.sendfile(out.fileno(), src.fileno(), offset, blocksize)
+        except OSError:
+            if offset == 0:
+                return False
+            raise
+        if sent == 0:
+            return True
+        offset += sent
+
+def _copy_file(src, out):
+    """Appends the contents of the binary file src to the binary stream out.
+
+    On Linux the data is copied kernel-to-kernel with os.sendfile, so it never
+    passes through a Python object. Elsewhere (or if sendfile turns out not to
+    work for this file) larger files are mmapped and the mapping is written
+    directly, letting the page cache supply the data.
+    """
+    if _USE_SENDFILE and _sendfile(src, out):
+        return
+
+    # Below the threshold the mapping setup costs more than a plain read
+    if os.fstat(src.fileno()).st_size >= MMAP_THRESHOLD:
+        try:
+            mm = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            pass  # not mappable (or emptied meanwhile); copy it normally
+        else:
+            with mm:
+                out.write(mm)
+            return
+    shutil.copyfileobj(src, out, COPY_CHUNK_SIZE)
+
+# Readahead hints are POSIX-only; DirEntry.inode() is also free there (it comes
+# from readdir), while on Windows it would cost a stat() per file
+_USE_FADVISE = hasattr(os, "posix_fadvise")
+
+def _prefetch(paths):
+    """Asks the kernel to start reading each file into the page cache.
+
+    paths should be in inode order: on spinning disks (or a cold cache) that
+    is roughly on-disk order, so the readahead avoids most of the seeking that
+    reading in alphabetical order would cause.
+    """
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue  # reported properly when the file is copied
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+def _log(message):
+    """Writes a line to stdout, escaping whatever its encoding can't represent.
+
+    File names that aren't valid UTF-8 reach us as surrogate escapes, which
+    would otherwise make the write raise UnicodeEncodeError.
+    """
+    encoding = sys.stdout.encoding or "utf-8"
+    sys.stdout.write(message.encode(encoding, "backslashreplace").decode(encoding) + "\n")
+
+def _write_error(out, relative_file_path, path_bytes, e):
+    """Writes the ERROR READING FILE marker for a file that couldn't be copied."""
+    out.writelines((
+        _ERROR_PREFIX, path_bytes, _MID,
+        f"--- Error: {str(e)} ---\n".encode("utf-8", "surrogateescape"),
+    ))
+    _log(f"Error reading {relative_file_path}: {e}")
+
+def _append_file(out, relative_file_path, file_path):
+    """Appends one file with its START/END markers, or an ERROR marker.
+
+    Returns True if the file was copied completely.
+    """
+    path_bytes = relative_file_path.encode("utf-8", "surrogateescape")
+    try:
+        src = open(file_path, "rb")
+    except Exception as e:
+        _write_error(out, relative_file_path, path_bytes, e)
+        return False
+
+    with src:
+        out.writelines((_START, path_bytes, _MID))
+        try:
+            _copy_file(src, out)
+        except Exception as e:
+            # Whatever was copied stays; the marker flags it as incomplete
+            _write_error(out, relative_file_path, path_bytes, e)
+            return False
+        out.writelines((_END_PREFIX, path_bytes, _MID))
+    return True
+
+def _write_shard(shard, tmp_dir, progress, total, verbose):
+    """Writes the delimited contents of shard's files to an anonymous temp file.
+
+    progress is an itertools.count shared by all shards (next() on it is
+    atomic), advanced once each file has been handled and used to report
+    overall progress every PROGRESS_INTERVAL files and at the end.
+    Returns (tmp_file, file_count); the caller is responsible for closing
+    tmp_file, which deletes it.
+    """
+    tmp = tempfile.TemporaryFile(dir=tmp_dir, buffering=OUTPUT_BUFFER_SIZE)
+    try:
+        file_count = 0
+        for relative_file_path, file_path in shard:
+            if verbose:
+                _log(f"Processing: {relative_file_path}")
+            if _append_file(tmp, relative_file_path, file_path):
+                file_count += 1
+
+            done = next(progress)
+            if not verbose and (done % PROGRESS_INTERVAL == 0 or done == total):
+                _log(f"Processed {done}/{total} files")
+
+        tmp.flush()
+        tmp.seek(0)
+    except BaseException:
+        # Don't leave a half-written temp file open until garbage collection
+        tmp.close()
+        raise
+    return tmp, file_count
 
 def main():
+    parser = argparse.ArgumentParser(description="Combine the project's source files into a single text file.")
+    parser.add_argument("--verbose", action="store_true",
+                        help="log every file that is processed, ignored or skipped")
+    args = parser.parse_args()
+
     project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
     output_file_path = os.path.join(project_root, OUTPUT_FILENAME)
 
@@ -62,49 +264,79 @@ def main():
     print(f"Project root: {project_root}")
     print(f"Outputting to: {output_file_path}")
 
-    combined_content = []
     file_count = 0
 
-    combined_content.append(f"--- Combined Project Text ---")
-    combined_content.append(f"--- Generated on: {datetime.datetime.now().isoformat()} ---")
-    combined_content.append(f"--- Project Root: {project_root} ---")
-    combined_content.append("\n--- Note: This file combines various text-based source files from the project. ---")
-    combined_content.append("--- Binary files, specific assets, and configured ignore patterns are excluded. ---")
-    combined_content.append("-" * 80)
-
-    for root, dirs, files in os.walk(project_root, topdown=True):
-        # Filter directories to ignore
-        dirs[:] = [d for d in dirs if not should_ignore(os.path.join(root, d), project_root)]
+    # Collect the files first so they can be written out in a stable order
+    text_files = []
+    inode_order = []
+    def report_unreadable(e):
+        _log(f"Skipping unreadable directory: {e}")
 
-        for file in files:
-            file_path = os.path.join(root, file)
-            relative_file_path = os.path.relpath(file_path, project_root)
+    for entry, relative_file_path, ignored in _scan(project_root, onerror=report_unreadable if args.verbose else None):
+        if ignored:
+            if args.verbose:
+                _log(f"Ignoring: {relative_file_path}")
+            continue
 
-            if should_ignore(file_path, project_root):
-                print(f"Ignoring: {relative_file_path}")
-                continue
+        if is_text_file(entry.name):
+            text_files.append((relative_file_path, entry.path))
+            if _USE_FADVISE:
+                inode_order.append((entry.inode(), entry.path))
+        elif args.verbose:
+            _log(f"Skipping (not a text file or explicitly ignored): {relative_file_path}")
+    text_files.sort()
 
-            if is_text_file(file):
-                print(f"Processing: {relative_file_path}")
-                try:
-                    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                        content = f.read()
-                    
-                    combined_content.append(f"\n\n--- START FILE: {relative_file_path.replace("\\\\", "/")} ---")
-                    combined_content.append(content)
-                    combined_content.append(f"--- END FILE: {relative_file_path.replace("\\\\", "/")} ---")
-                    file_count += 1
-                except Exception as e:
-                    combined_content.append(f"\n\n--- ERROR READING FILE: {relative_file_path.replace("\\\\", "/")} ---")
-                    combined_content.append(f"--- Error: {str(e)} ---")
-                    print(f"Error reading {relative_file_path}: {e}")
-            else:
-                print(f"Skipping (not a text file or explicitly ignored): {relative_file_path}")
+    # Warm the page cache in physical order; the output is still emitted in
+    # sorted path order below
+    inode_order.sort()
+    _prefetch(file_path for _, file_path in inode_order)
 
+    # Split the (sorted) files into contiguous shards that are written to temp
+    # files in parallel, then concatenated into the output in order. The temp
+    # files live next to the output so the final copies stay on one filesystem.
+    # File contents never sit in Python memory (one write buffer per shard),
+    # but every shard is submitted up front, so if appending falls behind the
+    # finished temp files can hold up to a full copy of the output on disk.
+    shard_count = max(1, min(os.cpu_count() or 1, len(text_files)))
+    shard_size = max(1, -(-len(text_files) // shard_count))
+    shards = [text_files[i:i + shard_size] for i in range(0, len(text_files), shard_size)]
 
     try:
-        with open(output_file_path, "w", encoding="utf-8") as f:
-            f.write("\n".join(combined_content))
+        with open(output_file_path, "wb", buffering=OUTPUT_BUFFER_SIZE) as out:
+            out.writelines([
+                b"--- Combined Project Text ---\n",
+                f"--- Generated on: {datetime.datetime.now().isoformat()} ---\n".encode("utf-8"),
+                f"--- Project Root: {project_root} ---\n".encode("utf-8"),
+                b"\n--- Note: This file combines various text-based source files from the project. ---\n",
+                b"--- Binary files, specific assets, and configured ignore patterns are excluded. ---\n",
+                b"-" * 80 + b"\n",
+            ])
+
+            write_shard = partial(
+                _write_shard,
+                tmp_dir=os.path.dirname(output_file_path),
+                progress=itertools.count(1),
+                total=len(text_files),
+                verbose=args.verbose,
+            )
+            with ThreadPoolExecutor(max_workers=len(shards) or 1) as executor:
+                futures = [executor.submit(write_shard, shard) for shard in shards]
+                try:
+                    # Consumed in order, so shard i is appended while the later
+                    # ones are still being written
+                    for future in futures:
+                        tmp, shard_file_count = future.result()
+                        with tmp:
+                            _copy_file(tmp, out)
+                        file_count += shard_file_count
+                except BaseException:
+                    # Close (and so delete) every temp file the other shards
+                    # produce; closing an already appended one is a no-op
+                    for future in futures:
+                        if not future.cancel() and future.exception() is None:
+                            future.result()[0].close()
+                    raise
+
         print(f"\nSuccessfully combined {file_count} text files into {output_file_path}")
     except Exception as e:
         print(f"\nError writing to output file {output_file_path}: {e}")
@@ -3,10 +3,14 @@
 Script to update Cargo.toml files to use workspace dependencies
 """
 
+import io
+import json
 import os
 import re
-from pathlib import Path
-Workspace dependencies from main Cargo.toml
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+# Workspace dependencies from main Cargo.toml
 
 WORKSPACE_DEPS = {
 # Core Technologies
@@ -119,86 +123,199 @@ WORKSPACE_DEPS = {
 
 }
 
+# Directories that never hold workspace members; build output and vendored
+# registries can contain thousands of third-party Cargo.toml files
+SKIP_DIRS = {'target', '.git', 'node_modules', '.cargo'}
+
+# Sidecar recording the mtime of every manifest after the last run, so files
+# that haven't been touched since are skipped
+CACHE_FILENAME = '.update_cargo_cache.json'
+
+# Section headers whose entries are candidates for workspace = true
+_DEP_HEADERS = ('[dependencies]', '[dev-dependencies]', '[build-dependencies]')
+
+# Compiled once instead of going through re's pattern cache for every line
+_DEP_RE = re.compile(r'^(\s*)([a-zA-Z0-9_-]+)\s*=\s*(.+)$')
+_FEATURES_RE = re.compile(r'features\s*=\s*(\[[^\]]*\])')
+_OPTIONAL_RE = re.compile(r'optional\s*=\s*(true|false)')
+
 def update_cargo_toml(file_path):
-"""Update a single Cargo.toml file to use workspace dependencies"""
-print(f"Updating {file_path}")
-   
-with open(file_path, 'r') as f:
-    content = f.read()
-
-lines = content.split('\n')
-updated_lines = []
-in_dependencies = False
-
-for line in lines:
-    # Check if we're in a dependencies section
-    if line.strip().startswith('[dependencies]') or line.strip().startswith('[dev-dependencies]') or line.strip().startswith('[build-dependencies]'):
-        in_dependencies = True
-        updated_lines.append(line)
-        continue
-    elif line.strip().startswith('[') and in_dependencies:
-        in_dependencies = False
-        updated_lines.append(line)
-        continue
-    
-    if in_dependencies and '=' in line and not line.strip().startswith('#'):
-        # Parse dependency line
-        dep_match = re.match(r'^(\s*)([a-zA-Z0-9_-]+)\s*=\s*(.+)$', line)
-        if dep_match:
+    """Update a single Cargo.toml file to use workspace dependencies"""
+    print(f"Updating {file_path}")
+
+    # Lines are read one at a time (keeping their '\n') and written straight
+    # into a single buffer, instead of splitting and re-joining the file
+    updated = io.StringIO()
+    in_dependencies = False
+    changed = False
+
+    with open(file_path, 'r') as f:
+        for line in f:
+            stripped = line.lstrip()
+
+            # Every section header decides whether we're in a dependencies section
+            if stripped.startswith('['):
+                in_dependencies = stripped.startswith(_DEP_HEADERS)
+                updated.write(line)
+                continue
+
+            # Cheap rejects before the regex: only non-comment lines containing
+            # an '=' inside a dependencies section can be dependency specs
+            if not in_dependencies or '=' not in line or stripped.startswith('#'):
+                updated.write(line)
+                continue
+
+            # Parse dependency line ('$' matches before the trailing newline)
+            dep_match = _DEP_RE.match(line)
+            if not dep_match:
+                updated.write(line)
+                continue
             indent, dep_name, dep_value = dep_match.groups()
-            
-            # Check if this dependency is in our workspace
-            if dep_name in WORKSPACE_DEPS:
-                # Check if it's already using workspace = true
-                if 'workspace = true' not in dep_value:
-                    # Parse the existing dependency to preserve features and other options
-                    if dep_value.strip().startswith('{'):
-                        # Complex dependency specification
-                        # Try to preserve features while using workspace
-                        features_match = re.search(r'features\s*=\s*(\[[^\]]*\])', dep_value)
-                        optional_match = re.search(r'optional\s*=\s*(true|false)', dep_value)
-                        
-                        new_dep = '{ workspace = true'
-                        if features_match:
-                            new_dep += f', features = {features_match.group(1)}'
-                        if optional_match:
-                            new_dep += f', optional = {optional_match.group(1)}'
-                        new_dep += ' }'
-                        
-                        updated_lines.append(f'{indent}{dep_name} = {new_dep}')
-                    else:
-                        # Simple version specification
-                        updated_lines.append(f'{indent}{dep_name} = {{ workspace = true }}')
-                else:
-                    updated_lines.append(line)
+
+            # Check if this dependency is in our workspace and not already using workspace = true
+            if dep_name not in WORKSPACE_DEPS or 'workspace = true' in dep_value:
+                updated.write(line)
+                continue
+
+            # Parse the existing dependency to preserve features and other options
+            if dep_value.strip().startswith('{'):
+                # Complex dependency specification
+                # Try to preserve features while using workspace
+                features_match = _FEATURES_RE.search(dep_value)
+                optional_match = _OPTIONAL_RE.search(dep_value)
+
+                new_dep = '{ workspace = true'
+                if features_match:
+                    new_dep += f', features = {features_match.group(1)}'
+                if optional_match:
+                    new_dep += f', optional = {optional_match.group(1)}'
+                new_dep += ' }'
             else:
-                updated_lines.append(line)
-        else:
-            updated_lines.append(line)
-    else:
-        updated_lines.append(line)
+                # Simple version specification
+                new_dep = '{ workspace = true }'
 
-# Write back the updated content
-with open(file_path, 'w') as f:
-    f.write('\n'.join(updated_lines))
+            newline = '\n' if line.endswith('\n') else ''
+            new_line = f'{indent}{dep_name} = {new_dep}{newline}'
+            changed = changed or new_line != line
+            updated.write(new_line)
 
-def main():
-"""Find and update all Cargo.toml files"""
-root_dir = Path('.')
-      
-# Find all Cargo.toml files except the root one
-cargo_files = []
-for cargo_file in root_dir.rglob('Cargo.toml'):
-    if cargo_file != Path('./Cargo.toml'):  # Skip root Cargo.toml
-        cargo_files.append(cargo_file)
+    # Leave untouched manifests alone so their mtimes (and anything keyed on
+    # them, like cargo's build cache) stay valid
+    if not changed:
+        return
 
-print(f"Found {len(cargo_files)} Cargo.toml files to update")
+    # Write back the updated content via a temporary file, so an interrupted
+    # run can't leave a truncated Cargo.toml behind. Symlinks are resolved so
+    # the link survives and its target is what gets rewritten, and the
+    # original file's mode is carried over to the new inode.
+    # mkstemp picks an unused name, so an existing file isn't clobbered and
+    # concurrent runs can't collide on the same temp file.
+    real_path = os.path.realpath(file_path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(real_path),
+                                    prefix=f'.{os.path.basename(real_path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(updated.getvalue())
+        shutil.copymode(real_path, tmp_path)
+        os.replace(tmp_path, real_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def find_cargo_tomls(root):
+    """Yield the path of every Cargo.toml below root, pruning SKIP_DIRS"""
+    stack = [root]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue  # unreadable directory, skipped like rglob did
+        with it:
+            for entry in it:
+                # is_dir()/name come from readdir, so no stat() per entry
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in SKIP_DIRS:
+                        stack.append(entry.path)
+                elif entry.name == 'Cargo.toml':
+                    yield entry.path
 
-for cargo_file in cargo_files:
+def _try_update(file_path):
+    """Runs update_cargo_toml in a worker, returning the error instead of raising it"""
     try:
-        update_cargo_toml(cargo_file)
+        update_cargo_toml(file_path)
     except Exception as e:
-        print(f"Error updating {cargo_file}: {e}")
+        return e
+    return None
+
+def _load_cache(cache_path):
+    """Return the {abspath: mtime_ns} map from the last run, or {} if it's stale"""
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # A manifest is only a no-op for the dependency list it was last run with
+    if cache.get('workspace_deps') != sorted(WORKSPACE_DEPS):
+        return {}
+    return cache.get('mtimes', {})
+
+def _mtime_ns(path):
+    """Return path's st_mtime_ns, or None if it can no longer be stat'ed"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _save_cache(cache_path, mtimes):
+    with open(cache_path, 'w') as f:
+        json.dump({'workspace_deps': sorted(WORKSPACE_DEPS), 'mtimes': mtimes}, f)
+
+def main():
+    """Find and update all Cargo.toml files"""
+    root_dir = '.'
+      
+    # Find all Cargo.toml files except the root one
+    # Symlinks can make several paths lead to one manifest; keep one path per
+    # target so two workers never rewrite the same file at once
+    root_cargo_toml = os.path.realpath(os.path.join(root_dir, 'Cargo.toml'))
+    by_target = {}
+    for cargo_file in sorted(find_cargo_tomls(root_dir)):
+        by_target.setdefault(os.path.realpath(cargo_file), cargo_file)
+    by_target.pop(root_cargo_toml, None)
+    cargo_files = list(by_target.values())
+
+    # Skip the files that haven't changed since the last run. Only manifests
+    # that still exist are kept, so entries for deleted or moved ones don't
+    # pile up in the cache.
+    cache_path = os.path.join(root_dir, CACHE_FILENAME)
+    current = {os.path.abspath(p) for p in cargo_files}
+    mtimes = {k: v for k, v in _load_cache(cache_path).items() if k in current}
+    stale_files = []
+    for cargo_file in cargo_files:
+        mtime = _mtime_ns(cargo_file)
+        if mtime is None:
+            continue  # removed since the walk
+        if mtimes.get(os.path.abspath(cargo_file)) != mtime:
+            stale_files.append(cargo_file)
+
+    print(f"Found {len(cargo_files)} Cargo.toml files, {len(stale_files)} to update")
+
+    # Every manifest is independent and the work is regex-bound, so spread the
+    # files over processes rather than threads to get around the GIL
+    with ProcessPoolExecutor() as executor:
+        errors = executor.map(_try_update, stale_files, chunksize=8)
+        for cargo_file, error in zip(stale_files, errors):
+            if error is not None:
+                print(f"Error updating {cargo_file}: {error}")
+                continue
+            mtime = _mtime_ns(cargo_file)
+            if mtime is not None:
+                mtimes[os.path.abspath(cargo_file)] = mtime
+
+    _save_cache(cache_path, mtimes)
 
-if name == 'main':
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    main()